@@ -0,0 +1,43 @@
+"""Move long-expired memberships out of the hot members collection.
+
+Usage: python -m application.archive [days_expired] [batch_size]
+"""
+import logging
+import sys
+from datetime import timedelta
+
+from .models import MemberArchive
+
+logger = logging.getLogger(__name__)
+
+
+def format_size(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def run_archival(days_expired=90, batch_size=500):
+    """Archive memberships expired for more than days_expired days and log hot/cold sizes"""
+    moved = MemberArchive.archive_expired(timedelta(days=days_expired), batch_size)
+    report = MemberArchive.stats()
+    logger.info(f"Archived {moved} memberships")
+    for name, stats in report.items():
+        logger.info(
+            f"{name}: {stats['count']} docs, data {format_size(stats['size'])}, "
+            f"storage {format_size(stats['storage_size'])}, "
+            f"indexes {format_size(stats['index_size'])}"
+        )
+    return moved, report
+
+
+if __name__ == '__main__':
+    from . import app
+
+    logging.basicConfig(level=logging.INFO)
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    with app.app_context():
+        run_archival(days, batch)
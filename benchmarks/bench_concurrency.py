@@ -0,0 +1,149 @@
+"""Compare sync and gevent gunicorn workers on the real webhook path.
+
+Runs the actual ``wsgi:app`` with gunicorn.conf.py, one worker process per
+mode, against a mock MongoDB (wire protocol) and a mock HTTP provider
+serving both Flutterwave and the Telegram Bot API. Each request is a
+Flutterwave webhook, which goes through the rate limiter, verifies the
+transaction over HTTP (requests), credits the user in MongoDB (pymongo)
+and sends a confirmation (telebot).
+
+Run with: python benchmarks/bench_concurrency.py [concurrency] [requests]
+Requires the app's dependencies plus gunicorn and gevent.
+"""
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_services import MockHTTP, MockMongo, start
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Top-level files of the deployed layout; every other module belongs to the package
+TOP_LEVEL = {'config.py', 'wsgi.py', 'gunicorn.conf.py'}
+NOT_IN_PACKAGE = TOP_LEVEL | {'app.py', 'init.py'}
+
+MONGO_LATENCY = float(os.getenv('BENCH_MONGO_LATENCY', '0.02'))
+HTTP_LATENCY = float(os.getenv('BENCH_HTTP_LATENCY', '0.1'))
+
+WEBHOOK_BODY = b'{"status": "successful", "id": 4975363}'
+
+
+def build_tree(root):
+    """Lay the repo out as application/ + top-level files, as the README describes"""
+    package = os.path.join(root, 'application')
+    os.mkdir(package)
+    for name in os.listdir(REPO_DIR):
+        if not name.endswith('.py'):
+            continue
+        target = root if name in TOP_LEVEL else package
+        if name in NOT_IN_PACKAGE and name not in TOP_LEVEL:
+            continue
+        os.symlink(os.path.join(REPO_DIR, name), os.path.join(target, name))
+    os.symlink(os.path.join(BENCH_DIR, 'bench_init.py'), os.path.join(package, '__init__.py'))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(port, server, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"gunicorn did not start on port {port}")
+
+
+def post(url):
+    start = time.monotonic()
+    request = urllib.request.Request(url, data=WEBHOOK_BODY, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return time.monotonic() - start, status
+
+
+def run(root, worker_class, concurrency, total, env, mongo):
+    port = free_port()
+    env = dict(env, PORT=str(port), GUNICORN_WORKER_CLASS=worker_class,
+               WEB_CONCURRENCY='1', GUNICORN_WORKER_CONNECTIONS=str(max(concurrency, 100)),
+               GUNICORN_TIMEOUT='300')
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning', 'wsgi:app']
+    server = subprocess.Popen(cmd, cwd=root, env=env)
+    try:
+        wait_for(port, server)
+        url = f'http://127.0.0.1:{port}/flutterwave-webhook'
+        post(url)  # warm up connections
+        commands_before = mongo.commands
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: post(url), range(total)))
+        elapsed = time.monotonic() - start
+        commands = mongo.commands - commands_before
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, status in results if status != 200)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{worker_class:>6}: {total / elapsed:8.1f} req/s, "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms, "
+        f"{errors} errors, {commands} mongo commands"
+    )
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    mongo = start(MockMongo(latency=MONGO_LATENCY))
+    http = start(MockHTTP(latency=HTTP_LATENCY))
+    root = tempfile.mkdtemp(prefix='tgm-bench-')
+    build_tree(root)
+
+    env = dict(
+        os.environ,
+        MONGODB_URI=f'mongodb://127.0.0.1:{mongo.port}/telegrambot?directConnection=true',
+        BENCH_MOCK_HTTP_URL=f'http://127.0.0.1:{http.port}',
+        TELEGRAM_BOT_TOKEN='123456:bench-token',
+        KOYEB_DOMAIN='bench.invalid',
+        COINBASE_API_KEY='bench', COINBASE_WEBHOOK_SECRET='bench',
+        FLUTTERWAVE_SECRET_KEY='bench', FLUTTERWAVE_PUBLIC_KEY='bench',
+        PAYPAL_CLIENT_ID='bench', PAYPAL_CLIENT_SECRET='bench',
+        SUCCESS_REDIRECT_URL='https://bench.invalid/success',
+        CANCEL_REDIRECT_URL='https://bench.invalid/cancel',
+        RATELIMIT_WEBHOOK='1000000/hour'
+    )
+
+    print(f"1 worker process, {concurrency} concurrent clients, {total} Flutterwave webhooks; "
+          f"mock Mongo {MONGO_LATENCY * 1000:.0f} ms/command, mock HTTP {HTTP_LATENCY * 1000:.0f} ms/request")
+    try:
+        for worker_class in ('sync', 'gevent'):
+            run(root, worker_class, concurrency, total, env, mongo)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""``application/__init__.py`` for the package bench_concurrency.py assembles.
+
+It sets up the app the way init.py does, except for the python-telegram-bot
+polling Updater; init.py imports ``telegram_handlers``, which is not in this
+tree. Outbound HTTPS to the payment providers is routed to the mock provider
+by swapping the transport adapter on the shared session, and telebot is
+pointed at the mock Bot API; everything else is the real app.
+"""
+import os
+from urllib.parse import urlsplit
+
+import telebot
+from flask import Flask
+from flask_pymongo import PyMongo
+from requests.adapters import HTTPAdapter
+
+mongo = PyMongo()
+
+PROVIDER_HOSTS = ('api.flutterwave.com', 'api-m.paypal.com', 'api-m.sandbox.paypal.com')
+
+
+class MockProviderAdapter(HTTPAdapter):
+    """Sends requests for the real provider hosts to the mock provider instead"""
+    def __init__(self, target, **kwargs):
+        self.target = target
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        if url.hostname in PROVIDER_HOSTS:
+            request.url = f"{self.target}{url.path}" + (f"?{url.query}" if url.query else '')
+        return super().send(request, **kwargs)
+
+
+def create_app():
+    server = Flask(__name__, instance_relative_config=False)
+    server.config['MONGO_URI'] = os.environ['MONGODB_URI']
+    server.config['FLUTTERWAVE_SECRET_KEY'] = os.environ['FLUTTERWAVE_SECRET_KEY']
+    mongo.init_app(
+        server,
+        maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+        waitQueueTimeoutMS=int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+    )
+
+    mock = os.environ['BENCH_MOCK_HTTP_URL']
+    telebot.apihelper.API_URL = mock + '/bot{0}/{1}'
+    from .http_client import HTTP_POOL_SIZE, session
+    adapter = MockProviderAdapter(mock, pool_connections=HTTP_POOL_SIZE,
+                                  pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    with server.app_context():
+        from .routes import main_bp
+        server.register_blueprint(main_bp)
+    return server
+
+
+app = create_app()
@@ -0,0 +1,63 @@
+"""Microbenchmark for json_codec over recorded webhook/API payloads.
+
+Times json_codec.loads/dumps as shipped, once with orjson and once with
+the stdlib fallback (forced by setting json_codec.orjson to None).
+
+Run with: python benchmarks/bench_json.py [iterations]
+Requires the app's dependencies (json_codec imports flask).
+"""
+import os
+import sys
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import json_codec  # noqa: E402
+
+PAYLOAD_DIR = os.path.join(BENCH_DIR, 'payloads')
+
+
+def load_payloads():
+    payloads = {}
+    for name in sorted(os.listdir(PAYLOAD_DIR)):
+        if name.endswith('.json'):
+            with open(os.path.join(PAYLOAD_DIR, name), 'rb') as f:
+                payloads[name] = f.read()
+    return payloads
+
+
+def roundtrip(raw):
+    json_codec.dumps(json_codec.loads(raw))
+
+
+def measure(raw, iterations, backend):
+    """Microseconds per roundtrip with json_codec running on backend"""
+    installed = json_codec.orjson
+    if backend == 'json':
+        json_codec.orjson = None
+    try:
+        seconds = min(timeit.repeat(lambda: roundtrip(raw), number=iterations, repeat=3))
+    finally:
+        json_codec.orjson = installed
+    return seconds / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    backends = ['json']
+    if json_codec.orjson is not None:
+        backends.append('orjson')
+    else:
+        print("orjson not installed, only the stdlib fallback is measured")
+
+    for name, raw in load_payloads().items():
+        results = {backend: measure(raw, iterations, backend) for backend in backends}
+        line = ", ".join(f"{b}: {us:.2f} us" for b, us in results.items())
+        if 'orjson' in results:
+            line += f" ({results['json'] / results['orjson']:.1f}x)"
+        print(f"{name} ({len(raw)} bytes) json_codec decode+encode -> {line}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Mock MongoDB and HTTP provider servers for bench_concurrency.py.
+
+MockMongo speaks just enough of the MongoDB wire protocol (OP_QUERY and
+OP_MSG) for pymongo to connect and run commands; every command waits
+``latency`` seconds and returns an empty but well-formed reply.
+MockHTTP stands in for the Telegram Bot API and Flutterwave.
+"""
+import datetime
+import json
+import socketserver
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bson
+from bson.int64 import Int64
+
+OP_REPLY = 1
+OP_QUERY = 2004
+OP_MSG = 2013
+HANDSHAKE_COMMANDS = {'hello', 'ismaster', 'isMaster'}
+
+
+def _read_cstring(data, offset):
+    end = data.index(b'\x00', offset)
+    return data[offset:end].decode(), end + 1
+
+
+class _MongoHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            header = self._recv(16)
+            if header is None:
+                return
+            length, request_id, _, opcode = struct.unpack('<iiii', header)
+            body = self._recv(length - 16)
+            if body is None:
+                return
+
+            if opcode == OP_QUERY:
+                offset = 4  # flags
+                db_name, offset = _read_cstring(body, offset)
+                offset += 8  # numberToSkip, numberToReturn
+                command = bson.decode(body[offset:offset + struct.unpack('<i', body[offset:offset + 4])[0]])
+                reply = bson.encode(self.server.respond(db_name.split('.')[0], command))
+                payload = struct.pack('<iqii', 8, 0, 0, 1) + reply
+                sock.sendall(struct.pack('<iiii', 16 + len(payload), 0, request_id, OP_REPLY) + payload)
+            elif opcode == OP_MSG:
+                flags = struct.unpack('<I', body[:4])[0]
+                command, offset = None, 4
+                end = len(body) - (4 if flags & 1 else 0)
+                while offset < end:
+                    kind = body[offset]
+                    offset += 1
+                    size = struct.unpack('<i', body[offset:offset + 4])[0]
+                    if kind == 0:
+                        command = bson.decode(body[offset:offset + size])
+                    offset += size
+                reply = self.server.respond(command.get('$db', 'admin'), command)
+                if flags & 2:  # moreToCome: unacknowledged write, no reply
+                    continue
+                payload = struct.pack('<I', 0) + b'\x00' + bson.encode(reply)
+                sock.sendall(struct.pack('<iiii', 16 + len(payload), 0, request_id, OP_MSG) + payload)
+            else:
+                return
+
+    def _recv(self, size):
+        chunks = bytearray()
+        while len(chunks) < size:
+            chunk = self.request.recv(size - len(chunks))
+            if not chunk:
+                return None
+            chunks += chunk
+        return bytes(chunks)
+
+
+class MockMongo(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, latency=0.02, host='127.0.0.1', port=0):
+        super().__init__((host, port), _MongoHandler)
+        self.latency = latency
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def respond(self, db_name, command):
+        name = next(iter(command))
+        if name in HANDSHAKE_COMMANDS:
+            return {
+                'ismaster': True,
+                'isWritablePrimary': True,
+                'helloOk': True,
+                'maxBsonObjectSize': 16 * 1024 * 1024,
+                'maxMessageSizeBytes': 48000000,
+                'maxWriteBatchSize': 100000,
+                'localTime': datetime.datetime.utcnow(),
+                'logicalSessionTimeoutMinutes': 30,
+                'connectionId': 1,
+                'minWireVersion': 0,
+                'maxWireVersion': 21,
+                'ok': 1.0
+            }
+
+        with self._lock:
+            self.commands += 1
+        time.sleep(self.latency)
+        collection = command[name] if isinstance(command[name], str) else ''
+        if name in ('find', 'aggregate'):
+            return {'cursor': {'id': Int64(0), 'ns': f'{db_name}.{collection}', 'firstBatch': []}, 'ok': 1.0}
+        if name == 'insert':
+            return {'n': len(command.get('documents', [])) or 1, 'ok': 1.0}
+        if name in ('update', 'delete'):
+            return {'n': 1, 'nModified': 1, 'ok': 1.0}
+        if name == 'findAndModify':
+            return {'value': {'count': 0, 'tat': datetime.datetime.utcnow()}, 'lastErrorObject': {'n': 1, 'updatedExisting': True}, 'ok': 1.0}
+        return {'ok': 1.0}
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        time.sleep(self.server.latency)
+        if '/verify' in self.path:
+            body = {
+                'status': 'success',
+                'data': {'status': 'successful', 'amount': 25, 'meta': {'chat_id': '593021774'}}
+            }
+        elif self.path.split('?')[0].endswith('/sendMessage'):
+            body = {
+                'ok': True,
+                'result': {'message_id': 1, 'date': 0, 'chat': {'id': 593021774, 'type': 'private'}}
+            }
+        else:
+            body = {'ok': True, 'result': True}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = _reply
+    do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+class MockHTTP(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency=0.1, host='127.0.0.1', port=0):
+        super().__init__((host, port), _HTTPHandler)
+        self.latency = latency
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,185 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the provider's circuit is open"""
+
+
+class ProviderError(Exception):
+    """Raised for provider replies that count against the circuit (5xx)"""
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker driven by rolling error rate and p95 latency.
+
+    The breaker opens when, over the last ``window`` seconds and at least
+    ``min_calls`` calls, the error rate or the p95 latency crosses its
+    threshold. After ``open_timeout`` seconds it hands out ``half_open_calls``
+    probe tickets; only a call holding one of those tickets can close the
+    circuit (on success) or reopen it (on failure).
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window=60, min_calls=10, max_error_rate=0.5,
+                 max_p95_latency=5.0, open_timeout=30, half_open_calls=1):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.max_error_rate = max_error_rate
+        self.max_p95_latency = max_p95_latency
+        self.open_timeout = open_timeout
+        self.half_open_calls = half_open_calls
+        self._calls = deque()  # (timestamp, latency, ok)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._generation = 0  # Bumped on every state change, invalidating old probe tickets
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def allow(self):
+        """Return a ticket if a call may go through right now, else None.
+
+        Pass the ticket back to record() when the call finishes.
+        """
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return (self._generation, False)
+            if state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return (self._generation, True)
+            return None
+
+    def record(self, ticket, latency, ok):
+        """Record the outcome of a call that was allowed through with ticket"""
+        generation, probe = ticket
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if probe:
+                if generation != self._generation or state != self.HALF_OPEN:
+                    # The half-open period this probe belonged to is over
+                    return
+                if ok:
+                    self._close()
+                    logger.info(f"Circuit for {self.name} closed")
+                else:
+                    self._open(now)
+                    logger.warning(f"Circuit for {self.name} reopened after failed probe")
+                return
+
+            if generation != self._generation:
+                # Started before the last state change; don't let it skew the new window
+                return
+            self._calls.append((now, latency, ok))
+            self._prune(now)
+            if state == self.CLOSED and len(self._calls) >= self.min_calls:
+                error_rate, p95 = self._stats()
+                if error_rate >= self.max_error_rate or p95 >= self.max_p95_latency:
+                    self._open(now)
+                    logger.warning(
+                        f"Circuit for {self.name} opened "
+                        f"(error rate {error_rate:.0%}, p95 {p95:.2f}s)"
+                    )
+
+    def stats(self):
+        """Return (error_rate, p95_latency) over the rolling window"""
+        with self._lock:
+            self._prune(time.monotonic())
+            return self._stats()
+
+    def call(self, func, *args, **kwargs):
+        """Run func through the breaker, raising CircuitOpenError when open"""
+        with self.guard():
+            return func(*args, **kwargs)
+
+    @contextmanager
+    def guard(self, is_failure=None):
+        """Context manager form of call().
+
+        An exception counts as a failure unless ``is_failure(exc)`` says
+        otherwise, so client errors (bad input, unknown ids) can be passed
+        through without tripping the circuit.
+        """
+        ticket = self.allow()
+        if ticket is None:
+            raise CircuitOpenError(f"{self.name} is temporarily unavailable")
+        start = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        except Exception as e:
+            ok = is_failure is not None and not is_failure(e)
+            raise
+        finally:
+            self.record(ticket, time.monotonic() - start, ok)
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.open_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+            self._generation += 1
+        return self._state
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._probes = 0
+        self._generation += 1
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._calls.clear()
+        self._probes = 0
+        self._generation += 1
+
+    def _prune(self, now):
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def _stats(self):
+        if not self._calls:
+            return 0.0, 0.0
+        failures = sum(1 for _, _, ok in self._calls if not ok)
+        latencies = sorted(latency for _, latency, _ in self._calls)
+        p95 = latencies[max(0, math.ceil(len(latencies) * 0.95) - 1)]
+        return failures / len(self._calls), p95
+
+
+# One breaker per payment provider
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """Return the shared breaker for a provider, creating it on first use"""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(provider, CircuitBreaker(provider))
+    return breaker
+
+
+def provider_health(provider):
+    """Sort key for a provider, lower is healthier; None while its circuit is open"""
+    breaker = get_breaker(provider)
+    state = breaker.state
+    if state == CircuitBreaker.OPEN:
+        return None
+    error_rate, p95 = breaker.stats()
+    return (state != CircuitBreaker.CLOSED, error_rate, p95)
@@ -73,8 +73,11 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = 300
     
     # Rate Limiting
-    RATELIMIT_DEFAULT = "300/hour"
+    RATELIMIT_DEFAULT = "300/hour"  # Per IP on HTTP routes
     RATELIMIT_STORAGE_URL = MONGO_URI
+    RATELIMIT_WEBHOOK = os.getenv('RATELIMIT_WEBHOOK', '3000/hour')  # Per IP on payment webhooks
+    RATELIMIT_USER = os.getenv('RATELIMIT_USER', '30/minute')  # Per Telegram user, all updates
+    RATELIMIT_DEPOSIT = os.getenv('RATELIMIT_DEPOSIT', '20/hour')  # Per Telegram user, /deposit and payment links
     
     # Security Settings
     SESSION_COOKIE_SECURE = True
@@ -89,8 +92,12 @@ class Config:
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     
-    def get_payment_providers(self):
-        """Get enabled payment providers based on configuration."""
+    def get_payment_providers(self, health=None):
+        """Get enabled payment providers based on configuration.
+
+        ``health`` optionally maps a provider name to a sort key (lower is
+        healthier) or None to hide it, e.g. circuit_breaker.provider_health.
+        """
         providers = []
         
         if self.COINBASE_API_KEY and self.COINBASE_API_KEY != 'your_coinbase_api_key':
@@ -114,7 +121,14 @@ class Config:
                 'enabled': True
             })
             
-        return providers
+        if health is None:
+            return providers
+
+        # Hide providers whose health is None (circuit open) and list the rest healthiest first
+        ranked = [(health(provider['provider']), provider) for provider in providers]
+        ranked = [item for item in ranked if item[0] is not None]
+        ranked.sort(key=lambda item: item[0])
+        return [provider for _, provider in ranked]
 
     def calculate_platform_fee(self, amount):
         """Calculate platform fee for a given amount."""
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from . import mongo
+
+logger = logging.getLogger(__name__)
+
+# Steps of each multi-message flow, in order
+FLOWS = {
+    'deposit': ('amount', 'email', 'method'),
+}
+
+
+class Conversation:
+    """Finite-state view over one user's stored conversation state"""
+    def __init__(self, store, user_id, state):
+        self.store = store
+        self.user_id = str(user_id)
+        self.flow = state['flow']
+        self.step = state['step']
+        self.data = state['data']
+        self.version = state['version']
+
+    @property
+    def steps(self):
+        return FLOWS[self.flow]
+
+    def advance(self, **data):
+        """Record data for the current step and move to the next one.
+
+        Returns the new step, or None if the state was changed elsewhere
+        (another worker already handled this step, or the flow was restarted).
+        """
+        index = self.steps.index(self.step)
+        next_step = self.steps[min(index + 1, len(self.steps) - 1)]
+        state = self.store.update(self.user_id, self.version, next_step, dict(self.data, **data))
+        if state is None:
+            return None
+        self.step = state['step']
+        self.data = state['data']
+        self.version = state['version']
+        return self.step
+
+    def is_current(self):
+        """True if this is still the stored state, i.e. no other worker moved it on"""
+        return self.store.version(self.user_id) == self.version
+
+    def finish(self):
+        """End the flow and drop its state"""
+        self.store.clear(self.user_id)
+
+
+class ConversationStore:
+    """Per-user conversation state in MongoDB with a local LRU/TTL cache.
+
+    Every change is written straight to the ``conversations`` collection
+    and bumps the document's ``version``. Reads are served from the cache
+    without a round trip; a cached state may be behind if another worker
+    moved the flow on, so writes are a compare-and-set on ``version`` and
+    callers re-read with ``fresh=True`` when one fails. Misses go to
+    MongoDB and are never cached, since the flow may start on any worker.
+    """
+    def __init__(self, max_size=10000, ttl=timedelta(minutes=30)):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()  # user_id -> (state, expires_at)
+        self._lock = threading.Lock()
+
+    def start(self, user_id, flow):
+        """Begin a flow for a user, replacing any flow already in progress"""
+        doc = mongo.db.conversations.find_one_and_update(
+            {'user_id': str(user_id)},
+            {
+                '$set': {
+                    'flow': flow,
+                    'step': FLOWS[flow][0],
+                    'data': {},
+                    'updated_at': datetime.utcnow()
+                },
+                '$inc': {'version': 1}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return Conversation(self, user_id, self._remember(doc))
+
+    def current(self, user_id, flow=None, fresh=False):
+        """Return the user's active Conversation, optionally restricted to a flow.
+
+        ``fresh`` skips the cache and reads the stored state.
+        """
+        state = self.get(user_id, fresh=fresh)
+        if state is None or (flow and state['flow'] != flow):
+            return None
+        return Conversation(self, user_id, state)
+
+    def get(self, user_id, fresh=False):
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._cache.pop(user_id, None) if fresh else self._cache.get(user_id)
+            if entry is not None:
+                state, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._cache.move_to_end(user_id)
+                    return _copy_state(state)
+                del self._cache[user_id]
+
+        doc = mongo.db.conversations.find_one({'user_id': user_id})
+        if doc is None or datetime.utcnow() - doc['updated_at'] >= self.ttl:
+            return None
+        return _copy_state(self._remember(doc))
+
+    def version(self, user_id):
+        """Stored version of a user's state, or None; a covered query on the user_id/version index"""
+        head = mongo.db.conversations.find_one(
+            {'user_id': str(user_id)},
+            {'_id': 0, 'user_id': 1, 'version': 1}
+        )
+        return head['version'] if head else None
+
+    def update(self, user_id, version, step, data):
+        """Move a conversation to ``step`` if it is still at ``version``"""
+        user_id = str(user_id)
+        doc = mongo.db.conversations.find_one_and_update(
+            {'user_id': user_id, 'version': version},
+            {
+                '$set': {'step': step, 'data': data, 'updated_at': datetime.utcnow()},
+                '$inc': {'version': 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            # Our cached state is stale; make the next read go to MongoDB
+            with self._lock:
+                self._cache.pop(user_id, None)
+            return None
+        return _copy_state(self._remember(doc))
+
+    def clear(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._cache.pop(user_id, None)
+        mongo.db.conversations.delete_one({'user_id': user_id})
+
+    def _remember(self, doc):
+        state = {
+            'flow': doc['flow'],
+            'step': doc['step'],
+            'data': doc.get('data', {}),
+            'version': doc['version']
+        }
+        age = datetime.utcnow() - doc['updated_at']
+        expires_at = time.monotonic() + (self.ttl - age).total_seconds()
+        with self._lock:
+            self._cache[doc['user_id']] = (state, expires_at)
+            self._cache.move_to_end(doc['user_id'])
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return state
+
+
+def _copy_state(state):
+    return dict(state, data=dict(state['data']))
+
+
+# Initialize conversation store
+conversations = ConversationStore()
@@ -0,0 +1,199 @@
+"""Streaming CSV/NDJSON export of a group's members and payments.
+
+Usage: python -m application.export <group_chat_id> members|payments
+           [--format csv|ndjson] [--after <cursor>] [--gzip] [--output <file>]
+
+Each row carries a resume cursor: the member _id for members, and
+<member _id>:<payment index> for payments. --after skips up to and
+including that row.
+"""
+import argparse
+import csv
+import io
+import sys
+import zlib
+
+from bson import ObjectId
+
+from . import mongo
+from .json_codec import dumps
+
+# Flush a chunk to the client once it reaches this many bytes
+CHUNK_SIZE = 64 * 1024
+
+# Documents fetched per round trip from the cursor
+CURSOR_BATCH_SIZE = 1000
+
+EXPORT_FIELDS = {
+    'members': ['_id', 'chat_id', 'group_chat_id', 'status', 'joined_at', 'expiry', 'payments'],
+    'payments': ['cursor', '_id', 'chat_id', 'group_chat_id', 'timestamp', 'expiry']
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def parse_cursor(after):
+    """Split a resume cursor into (member _id, payment index or None)"""
+    member_id, _, index = after.partition(':')
+    if not ObjectId.is_valid(member_id) or (index and not index.isdigit()):
+        raise ValueError(f"Invalid resume cursor: {after}")
+    return ObjectId(member_id), int(index) if index else None
+
+
+def member_rows(group_chat_id, after=None):
+    """Yield one row per member, in _id order"""
+    query = {'group_chat_id': str(group_chat_id)}
+    if after:
+        query['_id'] = {'$gt': parse_cursor(after)[0]}
+    cursor = mongo.db.members.aggregate([
+        {'$match': query},
+        {'$sort': {'_id': 1}},
+        {'$project': {
+            'chat_id': 1,
+            'group_chat_id': 1,
+            'status': 1,
+            'joined_at': 1,
+            'expiry': 1,
+            # Restored members also count payments whose details were lost to archiving
+            'payments': {'$add': [
+                {'$size': {'$ifNull': ['$payment_history', []]}},
+                {'$ifNull': ['$archived_payments', 0]}
+            ]}
+        }}
+    ], batchSize=CURSOR_BATCH_SIZE)
+    for doc in cursor:
+        yield doc
+
+
+def payment_rows(group_chat_id, after=None):
+    """Yield one row per payment, in (member _id, payment index) order"""
+    pipeline = [{'$match': {'group_chat_id': str(group_chat_id)}}]
+    if after:
+        member_id, index = parse_cursor(after)
+        if index is None:
+            pipeline[0]['$match']['_id'] = {'$gt': member_id}
+        else:
+            pipeline[0]['$match']['_id'] = {'$gte': member_id}
+    pipeline += [
+        {'$sort': {'_id': 1}},
+        {'$project': {'chat_id': 1, 'group_chat_id': 1, 'payment_history': 1}},
+        {'$unwind': {'path': '$payment_history', 'includeArrayIndex': 'payment_index'}}
+    ]
+    if after and index is not None:
+        # Rest of the member we stopped in, then everyone after
+        pipeline.append({'$match': {'$or': [
+            {'_id': {'$gt': member_id}},
+            {'payment_index': {'$gt': index}}
+        ]}})
+    pipeline.append({'$project': {
+        'chat_id': 1,
+        'group_chat_id': 1,
+        'payment_index': 1,
+        'timestamp': '$payment_history.timestamp',
+        'expiry': '$payment_history.expiry'
+    }})
+    cursor = mongo.db.members.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE)
+    for doc in cursor:
+        doc['cursor'] = f"{doc['_id']}:{doc.pop('payment_index')}"
+        yield doc
+
+
+EXPORTS = {
+    'members': member_rows,
+    'payments': payment_rows
+}
+
+
+def _serialize(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(rows, fields):
+    """Encode rows as CSV, yielding chunks of about CHUNK_SIZE bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_serialize(row.get(field)) for field in fields])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(rows, fields):
+    """Encode rows as newline-delimited JSON, yielding chunks of about CHUNK_SIZE bytes"""
+    chunk = bytearray()
+    for row in rows:
+        chunk += dumps({field: _serialize(row.get(field)) for field in fields})
+        chunk += b'\n'
+        if len(chunk) >= CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson
+}
+
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of byte chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(group_chat_id, kind, fmt='csv', after=None, compress=False):
+    """Return an iterator of byte chunks for the requested export"""
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export: {kind}")
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown format: {fmt}")
+    if after and parse_cursor(after)[1] is not None and kind != 'payments':
+        # Rows are generated lazily, so reject bad cursors before streaming starts
+        raise ValueError(f"Invalid resume cursor for {kind}: {after}")
+
+    chunks = ENCODERS[fmt](EXPORTS[kind](group_chat_id, after), EXPORT_FIELDS[kind])
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a group's members or payments")
+    parser.add_argument('group_chat_id')
+    parser.add_argument('kind', choices=sorted(EXPORTS))
+    parser.add_argument('--format', dest='fmt', choices=sorted(ENCODERS), default='csv')
+    parser.add_argument('--after', help="resume after the row with this cursor")
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--output', help="file to write, defaults to stdout")
+    args = parser.parse_args(argv)
+
+    from . import app
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        with app.app_context():
+            for chunk in export_stream(args.group_chat_id, args.kind, args.fmt, args.after, args.gzip):
+                out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+import os
+
+# Cooperative (gevent) workers by default; set GUNICORN_WORKER_CLASS=sync to opt out
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# Concurrent requests per gevent worker
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+
+# Load the app inside each worker, after the gevent worker has monkey-patched;
+# preloading in the master would import pymongo/requests unpatched
+preload_app = False
@@ -0,0 +1,21 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections per host; size it to the number of concurrent
+# requests a worker handles (gunicorn worker_connections in gevent mode)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))
+
+
+def create_session(pool_size=HTTP_POOL_SIZE):
+    """Create a requests session with a connection pool shared by all greenlets/threads"""
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+    return http
+
+
+# Shared HTTP session for payment providers and the Telegram API
+session = create_session()
@@ -21,7 +21,12 @@ def create_app():
     server.config['PORT'] = int(os.getenv('PORT', 8080))
     
     # Initialize MongoDB
-    mongo.init_app(server)
+    # Bounded pool so greenlets queue for a connection instead of opening one each
+    mongo.init_app(
+        server,
+        maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+        waitQueueTimeoutMS=int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+    )
     
     # Initialize Telegram bot
     telegram_token = os.getenv('TELEGRAM_BOT_TOKEN', config('TELEGRAM_BOT_TOKEN', default=''))
@@ -46,6 +51,10 @@ def create_app():
         # Register telegram handlers
         register_handlers(dispatcher)
         
+        # Send expiry reminders in the background
+        from .reminders import reminder_scheduler
+        reminder_scheduler.start()
+        
         # Start telegram bot polling in a separate thread
         updater.start_polling()
         
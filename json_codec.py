@@ -0,0 +1,48 @@
+import json
+import logging
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Use orjson when it is installed, otherwise fall back to the standard library
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def loads(data):
+    """Decode a JSON document from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encode an object to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def get_request_json(request):
+    """Decode the body of a Flask request, returning None when it is empty"""
+    data = request.get_data(cache=True)
+    if not data:
+        return None
+    return loads(data)
+
+
+def jsonify(obj):
+    """Drop-in replacement for flask.jsonify backed by the fast codec"""
+    return current_app.response_class(dumps(obj), mimetype='application/json')
+
+
+def response_json(response):
+    """Decode the body of a requests.Response"""
+    return loads(response.content)
@@ -1,6 +1,9 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from . import mongo
+from .conversation import conversations
+from .reminders import schedule_reminders
 from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 class User:
     """User model helper class for MongoDB"""
@@ -82,7 +85,16 @@ class Member:
             'status': 'active',
             'payment_history': []
         }
+        archived = MemberArchive.get(chat_id, group_chat_id)
+        if archived:
+            member['joined_at'] = archived['joined_at']
+            member['payment_history'] = archived.get('payment_history', [])
+            member['archived_payments'] = MemberArchive.dropped_payments(archived)
         mongo.db.members.insert_one(member)
+        if archived:
+            # Only drop the archived row once the hot row is safely written
+            MemberArchive.remove(archived['_id'])
+        schedule_reminders(chat_id, group_chat_id, expiry)
         return member
 
     @staticmethod
@@ -102,6 +114,17 @@ class Member:
 
     @staticmethod
     def update_expiry(chat_id, group_chat_id, new_expiry):
+        result = Member._update_expiry(chat_id, group_chat_id, new_expiry)
+        if result.matched_count == 0 and Member.restore(chat_id, group_chat_id):
+            # Re-subscribing member whose row had been archived
+            result = Member._update_expiry(chat_id, group_chat_id, new_expiry)
+        if result.matched_count:
+            # Renewal moves any pending reminders to the new expiry
+            schedule_reminders(chat_id, group_chat_id, new_expiry)
+        return result
+
+    @staticmethod
+    def _update_expiry(chat_id, group_chat_id, new_expiry):
         return mongo.db.members.update_one(
             {
                 'chat_id': str(chat_id),
@@ -121,6 +144,151 @@ class Member:
             }
         )
 
+    @staticmethod
+    def restore(chat_id, group_chat_id):
+        """Move an archived membership back into the hot collection"""
+        archived = MemberArchive.get(chat_id, group_chat_id)
+        if not archived:
+            return None
+        member = {
+            'chat_id': archived['chat_id'],
+            'group_chat_id': archived['group_chat_id'],
+            'expiry': archived['expiry'],
+            'joined_at': archived['joined_at'],
+            'status': archived['status'],
+            'payment_history': archived.get('payment_history', []),
+            'archived_payments': MemberArchive.dropped_payments(archived)
+        }
+        try:
+            mongo.db.members.insert_one(member)
+        except DuplicateKeyError:
+            # Restored concurrently, or the archiver has not removed the hot row yet;
+            # keep the archived row and let the caller update the existing one
+            return mongo.db.members.find_one({
+                'chat_id': member['chat_id'],
+                'group_chat_id': member['group_chat_id']
+            })
+        MemberArchive.remove(archived['_id'])
+        return member
+
+class MemberArchive:
+    """Cold storage for long-expired memberships"""
+    # Fields kept in the archived row; payment_history is kept whole (it is
+    # unindexed there), with a count and last payment time for quick reports
+    PROJECTION = {
+        'chat_id': 1,
+        'group_chat_id': 1,
+        'expiry': 1,
+        'joined_at': 1,
+        'status': 1,
+        'payment_history': 1,
+        'archived_payments': 1,
+        'payment_count': {'$add': [
+            {'$size': {'$ifNull': ['$payment_history', []]}},
+            {'$ifNull': ['$archived_payments', 0]}
+        ]},
+        'last_payment': {'$max': '$payment_history.timestamp'}
+    }
+
+    @staticmethod
+    def get(chat_id, group_chat_id):
+        """Return the archived row for a membership, if any"""
+        return mongo.db.members_archive.find_one({
+            'chat_id': str(chat_id),
+            'group_chat_id': str(group_chat_id)
+        })
+
+    @staticmethod
+    def remove(archive_id):
+        return mongo.db.members_archive.delete_one({'_id': archive_id})
+
+    @staticmethod
+    def dropped_payments(archived):
+        """Number of payments counted on an archived row but missing from its payment_history.
+
+        Rows archived before payment_history was kept only have the count.
+        """
+        return archived.get('payment_count', 0) - len(archived.get('payment_history', []))
+
+    @staticmethod
+    def archive_expired(older_than=timedelta(days=90), batch_size=500):
+        """Move memberships expired for longer than older_than to members_archive.
+
+        Works in batches of batch_size and returns the number of rows moved.
+        """
+        cutoff = (datetime.utcnow() - older_than).strftime('%Y-%m-%d %H:%M:%S')
+        query = {'status': {'$ne': 'active'}, 'expiry': {'$lt': cutoff}}
+        moved = 0
+
+        while True:
+            batch = list(mongo.db.members.aggregate([
+                {'$match': query},
+                {'$limit': batch_size},
+                {'$project': MemberArchive.PROJECTION}
+            ]))
+            if not batch:
+                break
+
+            now = datetime.utcnow()
+            for row in batch:
+                row['archived_at'] = now
+            try:
+                mongo.db.members_archive.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                if any(err['code'] != 11000 for err in e.details['writeErrors']):
+                    raise
+                MemberArchive._replace_leftovers([batch[err['index']] for err in e.details['writeErrors']])
+
+            # Only delete hot rows whose own copy (same _id) is in the archive
+            ids = [doc['_id'] for doc in mongo.db.members_archive.find(
+                {'_id': {'$in': [row['_id'] for row in batch]}}, {'_id': 1}
+            )]
+            mongo.db.members.delete_many({'_id': {'$in': ids}, **query})
+
+            # Drop archive copies of members renewed while the batch was in flight
+            renewed = [doc['_id'] for doc in mongo.db.members.find({'_id': {'$in': ids}}, {'_id': 1})]
+            if renewed:
+                mongo.db.members_archive.delete_many({'_id': {'$in': renewed}})
+
+            moved += len(ids) - len(renewed)
+            if len(batch) < batch_size:
+                break
+
+        return moved
+
+    @staticmethod
+    def _replace_leftovers(rows):
+        """Handle rows that hit a duplicate key while being archived.
+
+        A duplicate on _id means an interrupted run already archived the row.
+        A duplicate on (chat_id, group_chat_id) is a leftover from an earlier
+        archive of the membership whose remove failed after a restore; the
+        restore copied its data into the hot row, which supersedes it.
+        """
+        for row in rows:
+            if mongo.db.members_archive.count_documents({'_id': row['_id']}, limit=1):
+                continue
+            mongo.db.members_archive.delete_one({
+                'chat_id': row['chat_id'],
+                'group_chat_id': row['group_chat_id'],
+                '_id': {'$ne': row['_id']}
+            })
+            mongo.db.members_archive.insert_one(row)
+
+    @staticmethod
+    def stats():
+        """Report document count and storage/index sizes of the hot and cold collections"""
+        report = {}
+        for name in ('members', 'members_archive'):
+            stats = mongo.db.command('collStats', name)
+            report[name] = {
+                'count': stats.get('count', 0),
+                'size': stats.get('size', 0),
+                'storage_size': stats.get('storageSize', 0),
+                'index_size': stats.get('totalIndexSize', 0)
+            }
+        return report
+
 # Create indexes for better query performance
 def setup_indexes():
     """Create MongoDB indexes for better query performance"""
@@ -133,8 +301,32 @@ def setup_indexes():
     
     # Members collection indexes
     mongo.db.members.create_index([('chat_id', 1), ('group_chat_id', 1)], unique=True)
-    mongo.db.members.create_index('group_chat_id')
+    # group_chat_id + _id also serves _id-ordered streaming exports of a group
+    mongo.db.members.create_index([('group_chat_id', 1), ('_id', 1)])
     mongo.db.members.create_index('expiry')
+    
+    # Rate limit counters expire with their window
+    mongo.db.rate_limits.create_index('expires_at', expireAfterSeconds=0)
+    
+    # Reminders collection indexes
+    mongo.db.reminders.create_index('bucket')
+    
+    # Archived members collection indexes
+    mongo.db.members_archive.create_index([('chat_id', 1), ('group_chat_id', 1)], unique=True)
+    
+    # Conversations collection indexes
+    # Flow state used to be keyed by chat_id; it lives at most one TTL, so drop it
+    existing = mongo.db.conversations.index_information()
+    if 'chat_id_1' in existing:
+        mongo.db.conversations.delete_many({'user_id': {'$exists': False}})
+        for legacy in ('chat_id_1', 'chat_id_1_version_1'):
+            if legacy in existing:
+                mongo.db.conversations.drop_index(legacy)
+    mongo.db.conversations.create_index('user_id', unique=True)
+    mongo.db.conversations.create_index([('user_id', 1), ('version', 1)])
+    mongo.db.conversations.create_index(
+        'updated_at', expireAfterSeconds=int(conversations.ttl.total_seconds())
+    )
 
 # Example document structures for reference:
 user_structure = {
@@ -176,3 +368,37 @@ member_structure = {
         }
     ]
           }
+
+archived_member_structure = {
+    'chat_id': str,
+    'group_chat_id': str,
+    'expiry': str,
+    'joined_at': datetime,
+    'status': str,
+    'payment_history': list,  # Kept as in members
+    'archived_payments': int,  # Payments of rows archived before payment_history was kept
+    'payment_count': int,  # Total payments, including archived_payments
+    'last_payment': datetime,
+    'archived_at': datetime
+}
+
+reminder_structure = {
+    '_id': str,  # '<chat_id>:<group_chat_id>:<label>'
+    'chat_id': str,
+    'group_chat_id': str,
+    'label': str,  # '3d', '1d' or '1h' before expiry
+    'expiry': str,
+    'due_at': datetime,
+    'bucket': datetime,  # due_at floored to the minute
+    'status': str,  # 'pending' or 'claimed'; deleted once sent
+    'attempts': int
+}
+
+conversation_structure = {
+    'user_id': str,  # Telegram user ID of the member in the flow
+    'flow': str,  # e.g. 'deposit'
+    'step': str,  # e.g. 'amount', 'email', 'method'
+    'data': dict,  # Values collected so far
+    'version': int,  # Incremented on every change
+    'updated_at': datetime  # Expired by TTL index
+}
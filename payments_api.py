@@ -1,4 +1,3 @@
-import requests
 import json
 from datetime import datetime
 import hmac
@@ -7,11 +6,38 @@ from decouple import config
 import logging
 from coinbase_commerce import Client
 import base64
+from coinbase_commerce.error import APIError
+from .circuit_breaker import ProviderError, get_breaker
+from .http_client import session
+from .json_codec import response_json
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Seconds to wait on a provider before giving up
+REQUEST_TIMEOUT = 10
+
+def provider_request(provider, method, url, **kwargs):
+    """Send an HTTP request to a payment provider through its circuit breaker.
+
+    Connection errors, timeouts and 5xx replies count against the circuit
+    and are raised; any other response (including 4xx) is returned as is.
+    Raises CircuitOpenError without sending anything while the circuit is open.
+    """
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    with get_breaker(provider).guard():
+        response = session.request(method, url, **kwargs)
+        if response.status_code >= 500:
+            raise ProviderError(f"{provider} returned HTTP {response.status_code}")
+    return response
+
+def is_coinbase_failure(error):
+    """Coinbase SDK errors count against the circuit unless they are client errors"""
+    if isinstance(error, APIError) and error.http_status:
+        return error.http_status >= 500
+    return True
+
 class PaymentAPI:
     def __init__(self):
         # Coinbase configuration
@@ -45,14 +71,16 @@ class PaymentAPI:
             
             data = {'grant_type': 'client_credentials'}
             
-            response = requests.post(
+            response = provider_request(
+                'paypal',
+                'POST',
                 f"{self.paypal_base_url}/v1/oauth2/token",
                 headers=headers,
                 data=data
             )
             
             if response.status_code == 200:
-                return response.json()['access_token']
+                return response_json(response)['access_token']
             return None
         except Exception as e:
             logger.error(f"PayPal token error: {str(e)}")
@@ -82,7 +110,8 @@ class PaymentAPI:
             else:
                 charge_data["pricing_type"] = "no_price"
             
-            charge = self.coinbase_client.charge.create(**charge_data)
+            with get_breaker('coinbase').guard(is_failure=is_coinbase_failure):
+                charge = self.coinbase_client.charge.create(**charge_data)
             return charge.hosted_url
         except Exception as e:
             logger.error(f"Coinbase charge error: {str(e)}")
@@ -113,14 +142,16 @@ class PaymentAPI:
                 }
             }
             
-            response = requests.post(
+            response = provider_request(
+                'flutterwave',
+                'POST',
                 "https://api.flutterwave.com/v3/payments",
                 headers=headers,
                 json=data
             )
             
             if response.status_code == 200:
-                return response.json()['data']['link']
+                return response_json(response)['data']['link']
             return None
         except Exception as e:
             logger.error(f"Flutterwave charge error: {str(e)}")
@@ -153,14 +184,16 @@ class PaymentAPI:
                 }
             }
             
-            response = requests.post(
+            response = provider_request(
+                'paypal',
+                'POST',
                 f"{self.paypal_base_url}/v2/checkout/orders",
                 headers=headers,
                 json=data
             )
             
             if response.status_code == 201:
-                for link in response.json()['links']:
+                for link in response_json(response)['links']:
                     if link['rel'] == 'approve':
                         return link['href']
             return None
@@ -188,13 +221,15 @@ class PaymentAPI:
                 'Authorization': f'Bearer {self.flutterwave_secret}'
             }
             
-            response = requests.get(
+            response = provider_request(
+                'flutterwave',
+                'GET',
                 f"https://api.flutterwave.com/v3/transactions/{transaction_id}/verify",
                 headers=headers
             )
             
             if response.status_code == 200:
-                return response.json()['data']
+                return response_json(response)['data']
             return None
         except Exception as e:
             logger.error(f"Flutterwave verification error: {str(e)}")
@@ -212,13 +247,15 @@ class PaymentAPI:
                 'Content-Type': 'application/json'
             }
             
-            response = requests.get(
+            response = provider_request(
+                'paypal',
+                'GET',
                 f"{self.paypal_base_url}/v2/checkout/orders/{order_id}",
                 headers=headers
             )
             
             if response.status_code == 200:
-                return response.json()
+                return response_json(response)
             return None
         except Exception as e:
             logger.error(f"PayPal verification error: {str(e)}")
@@ -0,0 +1,195 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from . import mongo
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second.
+
+    The capacity defaults to one second of tokens, but never less than one
+    token, so rates below 1/s still let a call through every 1/rate seconds.
+    """
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        if self.capacity < 1:
+            raise ValueError(f"Token bucket capacity must be at least 1, got {capacity}")
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available, returning False instead of waiting"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available, then take them"""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Seconds per period name accepted in limit strings such as "300/hour"
+PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400
+}
+
+
+def parse_limit(limit):
+    """Parse a limit string like "300/hour" or "10 per minute" into (amount, seconds)"""
+    amount, _, period = limit.replace(' per ', '/').partition('/')
+    period = period.strip().lower().rstrip('s')
+    if period not in PERIODS:
+        raise ValueError(f"Invalid rate limit: {limit}")
+    return int(amount), PERIODS[period]
+
+
+class _Bucket:
+    __slots__ = ('interval', 'burst', 'remote_tat', 'pending', 'touched')
+
+    def __init__(self, interval, burst):
+        self.interval = interval  # Seconds per token
+        self.burst = burst  # Seconds of tokens the bucket holds (amount * interval)
+        self.remote_tat = 0.0  # Shared theoretical arrival time as of the last sync
+        self.pending = 0  # Local hits not yet written to Mongo
+        self.touched = True
+
+
+class SharedRateLimiter:
+    """Token-bucket rate limiter shared across workers through MongoDB.
+
+    Each (limit, key) is a bucket holding ``amount`` tokens that refill
+    evenly over the period, so there is no burst at window boundaries. A
+    bucket is stored GCRA-style as its theoretical arrival time (``tat``):
+    each hit pushes it forward by one token's worth of time, and a hit is
+    refused if that would put it more than a full bucket ahead of now.
+
+    hit() only looks at local state: the shared ``tat`` from the last sync
+    plus this worker's unsynced hits. A background thread adds those hits
+    to the ``rate_limits`` collection every ``sync_interval`` seconds and
+    reads back the shared value. Between syncs a key can overshoot by what
+    other workers admitted in that interval. If syncing fails for longer
+    than ``stale_after`` seconds, each unsynced local hit is counted
+    ``workers`` times, as if every worker had seen the same traffic.
+    """
+    def __init__(self, sync_interval=2.0, stale_after=10.0, workers=None):
+        self.sync_interval = sync_interval
+        self.stale_after = stale_after
+        self.workers = workers or max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+        self._buckets = {}
+        self._limits = {}
+        self._last_sync = time.time()
+        self._lock = threading.Lock()
+        self._syncer = None
+
+    def hit(self, limit, key):
+        """Take a token for key from limit's bucket; returns False if it is empty"""
+        parsed = self._limits.get(limit)
+        if parsed is None:
+            parsed = self._limits[limit] = parse_limit(limit)
+        amount, period = parsed
+
+        now = time.time()
+        bucket_id = f"{limit}:{key}"
+        scale = 1 if now - self._last_sync <= self.stale_after else self.workers
+        with self._lock:
+            bucket = self._buckets.get(bucket_id)
+            if bucket is None:
+                bucket = self._buckets[bucket_id] = _Bucket(period / amount, period)
+            bucket.touched = True
+            tat = max(bucket.remote_tat, now) + bucket.pending * bucket.interval * scale
+            if tat + bucket.interval - now > bucket.burst:
+                allowed = False
+            else:
+                bucket.pending += 1
+                allowed = True
+        self._ensure_syncer()
+        return allowed
+
+    def sync(self):
+        """Push local hits to MongoDB and pull the shared bucket state"""
+        now = time.time()
+        with self._lock:
+            idle = [
+                bucket_id for bucket_id, bucket in self._buckets.items()
+                if not bucket.pending and not bucket.touched and bucket.remote_tat <= now
+            ]
+            for bucket_id in idle:
+                # A full bucket needs no state
+                del self._buckets[bucket_id]
+            work = []
+            for bucket_id, bucket in self._buckets.items():
+                if bucket.pending or bucket.touched:
+                    work.append((bucket_id, bucket, bucket.pending))
+                    bucket.touched = False
+
+        now_dt = datetime.utcfromtimestamp(now)
+        for bucket_id, bucket, pending in work:
+            try:
+                doc = mongo.db.rate_limits.find_one_and_update(
+                    {'_id': bucket_id},
+                    [
+                        {'$set': {'tat': {'$add': [
+                            {'$max': [{'$ifNull': ['$tat', now_dt]}, now_dt]},
+                            int(pending * bucket.interval * 1000)
+                        ]}}},
+                        # The document can go once the bucket has refilled
+                        {'$set': {'expires_at': '$tat'}}
+                    ],
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                remote_tat = (doc['tat'] - EPOCH).total_seconds()
+            except Exception as e:
+                logger.error(f"Rate limit sync error: {str(e)}")
+                return
+            with self._lock:
+                bucket.pending -= pending
+                bucket.remote_tat = remote_tat
+        self._last_sync = time.time()
+
+    def _ensure_syncer(self):
+        if self._syncer is not None and self._syncer.is_alive():
+            return
+        with self._lock:
+            if self._syncer is None or not self._syncer.is_alive():
+                self._syncer = threading.Thread(target=self._sync_loop, name='rate-limit-sync', daemon=True)
+                self._syncer.start()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+
+# Initialize shared rate limiter
+limiter = SharedRateLimiter()
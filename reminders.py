@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from dateutil import parser as date_parser
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+
+from . import mongo
+from .rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Reminder offsets before expiry, keyed by the label stored on each reminder
+REMINDER_OFFSETS = {
+    '3d': timedelta(days=3),
+    '1d': timedelta(days=1),
+    '1h': timedelta(hours=1)
+}
+
+# Width of a time bucket; reminders due within the same minute share a bucket
+BUCKET_SECONDS = 60
+
+# Reminder messages per second across all workers; each worker's scheduler
+# gets an equal share, so WEB_CONCURRENCY must match the worker count
+REMINDER_SEND_RATE = float(os.getenv('REMINDER_SEND_RATE', 20))
+WORKER_COUNT = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+
+REMINDER_MESSAGES = {
+    '3d': "Your membership for group {group} expires in 3 days. Send /deposit to renew.",
+    '1d': "Your membership for group {group} expires tomorrow. Send /deposit to renew.",
+    '1h': "Your membership for group {group} expires in 1 hour. Send /deposit to renew now to keep access."
+}
+
+
+def bucket_for(when):
+    """Floor a datetime to the start of its time bucket"""
+    epoch = int(when.timestamp()) if when.tzinfo else int((when - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % BUCKET_SECONDS)
+
+
+def schedule_reminders(chat_id, group_chat_id, expiry):
+    """Precompute the T-3d/T-1d/T-1h reminders for a membership.
+
+    Reminder ids are derived from the membership, so calling this again
+    after a renewal replaces the pending reminders instead of adding more.
+    """
+    if not isinstance(expiry, datetime):
+        expiry = date_parser.parse(str(expiry))
+    if expiry.tzinfo is not None:
+        # Reminders are kept in naive UTC like the rest of the collections
+        expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+
+    now = datetime.utcnow()
+    ops = []
+    for label, offset in REMINDER_OFFSETS.items():
+        reminder_id = f"{chat_id}:{group_chat_id}:{label}"
+        due_at = expiry - offset
+        if due_at <= now:
+            # Too late for this one; drop any stale reminder from a previous expiry
+            ops.append(DeleteOne({'_id': reminder_id, 'status': 'pending'}))
+            continue
+        ops.append(UpdateOne(
+            {'_id': reminder_id},
+            {
+                '$set': {
+                    'chat_id': str(chat_id),
+                    'group_chat_id': str(group_chat_id),
+                    'label': label,
+                    'expiry': str(expiry),
+                    'due_at': due_at,
+                    'bucket': bucket_for(due_at),
+                    'status': 'pending',
+                    'attempts': 0
+                },
+                '$unset': {'claimed_by': '', 'claimed_at': ''}
+            },
+            upsert=True
+        ))
+    mongo.db.reminders.bulk_write(ops, ordered=False)
+
+
+class ReminderScheduler:
+    """Drains due reminder buckets and sends them through a rate-limited path.
+
+    Each reminder is claimed atomically before it is sent, so several
+    workers can run the scheduler without sending it twice in normal
+    operation. Delivery is at-least-once: a claim left by a crashed worker
+    becomes claimable again after ``claim_timeout``, and a reminder whose
+    delete fails after a successful send is sent again. Reminders for
+    memberships that are no longer active are dropped unsent.
+    """
+    def __init__(self, interval=30, max_per_tick=500, send_rate=REMINDER_SEND_RATE / WORKER_COUNT,
+                 claim_timeout=timedelta(minutes=5), max_attempts=3):
+        self.interval = interval
+        self.max_per_tick = max_per_tick
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.limiter = TokenBucket(send_rate)
+        self.worker_id = uuid.uuid4().hex
+        self._thread = None
+
+    def start(self):
+        """Run tick() every interval seconds in a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+
+    def tick(self, now=None):
+        """Send every reminder whose bucket has come due; returns the number sent"""
+        now = now or datetime.utcnow()
+        sent = 0
+        for _ in range(self.max_per_tick):
+            reminder = self._claim(now)
+            if reminder is None:
+                break
+            if not self._membership_active(reminder):
+                mongo.db.reminders.delete_one({'_id': reminder['_id'], 'claimed_by': self.worker_id})
+                continue
+            self.limiter.acquire()
+            if self._send(reminder):
+                mongo.db.reminders.delete_one({'_id': reminder['_id'], 'claimed_by': self.worker_id})
+                sent += 1
+            elif reminder.get('attempts', 0) + 1 >= self.max_attempts:
+                mongo.db.reminders.delete_one({'_id': reminder['_id'], 'claimed_by': self.worker_id})
+            else:
+                # Retry in the next bucket
+                mongo.db.reminders.update_one(
+                    {'_id': reminder['_id'], 'claimed_by': self.worker_id},
+                    {
+                        '$set': {
+                            'status': 'pending',
+                            'bucket': bucket_for(now) + timedelta(seconds=BUCKET_SECONDS)
+                        },
+                        '$inc': {'attempts': 1},
+                        '$unset': {'claimed_by': '', 'claimed_at': ''}
+                    }
+                )
+        return sent
+
+    def _claim(self, now):
+        # now is the tick's bucket cutoff; a tick can outlast claim_timeout,
+        # so claims are stamped and checked against the actual claim time
+        claimed_at = datetime.utcnow()
+        return mongo.db.reminders.find_one_and_update(
+            {
+                'bucket': {'$lte': bucket_for(now)},
+                '$or': [
+                    {'status': 'pending'},
+                    {'status': 'claimed', 'claimed_at': {'$lt': claimed_at - self.claim_timeout}}
+                ]
+            },
+            {'$set': {'status': 'claimed', 'claimed_by': self.worker_id, 'claimed_at': claimed_at}},
+            sort=[('bucket', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _membership_active(self, reminder):
+        return mongo.db.members.count_documents({
+            'chat_id': reminder['chat_id'],
+            'group_chat_id': reminder['group_chat_id'],
+            'status': 'active'
+        }, limit=1) > 0
+
+    def _send(self, reminder):
+        from .routes import bot
+
+        try:
+            bot.send_message(
+                reminder['chat_id'],
+                REMINDER_MESSAGES[reminder['label']].format(group=reminder['group_chat_id'])
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Reminder send error: {str(e)}")
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {str(e)}")
+            time.sleep(self.interval)
+
+
+# Initialize reminder scheduler
+reminder_scheduler = ReminderScheduler()
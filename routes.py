@@ -1,13 +1,25 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, current_app, Response, stream_with_context, url_for
 import telebot
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 import logging
 from coinbase_commerce.webhook import Webhook
 from coinbase_commerce.error import WebhookInvalidPayload, SignatureVerificationError
-import requests
 from datetime import datetime
 from bson.objectid import ObjectId
+from requests import RequestException
 from . import mongo
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, ProviderError, get_breaker, provider_health
+from .conversation import conversations
+from .export import export_stream, FORMATS
+from .http_client import session
+from .payments_api import payment_api, provider_request
+from .rate_limit import limiter
+from .models import Group
+from .json_codec import get_request_json, jsonify, response_json
+import hashlib
+import hmac
 import os
+from config import config
 
 # Create blueprint
 main_bp = Blueprint('main', __name__)
@@ -22,13 +34,26 @@ logger = logging.getLogger(__name__)
 
 # Initialize bot
 secret = "tgapi/v2"
+telebot.apihelper.session = session
 bot = telebot.TeleBot(os.getenv('TELEGRAM_BOT_TOKEN'), threaded=False)
 
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token on every update
+webhook_secret = os.getenv('TELEGRAM_WEBHOOK_SECRET') or hmac.new(
+    (os.getenv('TELEGRAM_BOT_TOKEN') or '').encode(), b'webhook', hashlib.sha256
+).hexdigest()
+
 # Update webhook for Koyeb
 koyeb_domain = os.getenv('KOYEB_DOMAIN')
 webhook_url = f"https://{koyeb_domain}/{secret}"
 bot.remove_webhook()
-bot.set_webhook(url=webhook_url)
+bot.set_webhook(url=webhook_url, secret_token=webhook_secret)
+
+# Button labels for each payment provider
+PAYMENT_METHOD_LABELS = {
+    'coinbase': "Crypto (Coinbase)",
+    'flutterwave': "Card (Flutterwave)",
+    'paypal': "PayPal"
+}
 
 def credit_payment(chat_id, amount):
     """Credit user account after successful payment"""
@@ -58,12 +83,53 @@ def credit_payment(chat_id, amount):
         logger.error(f"Credit error: {str(e)}")
         return False
 
+# Verification failures that should make a provider redeliver its webhook:
+# open circuit, 5xx from the provider, timeouts and connection errors
+PROVIDER_UNAVAILABLE = (CircuitOpenError, ProviderError, RequestException)
+
+# Endpoints called by payment providers, limited per IP with RATELIMIT_WEBHOOK
+WEBHOOK_ENDPOINTS = {'main.coinbase_webhook', 'main.flutterwave_webhook', 'main.paypal_webhook'}
+
+def client_ip():
+    """Client address as seen by the Koyeb proxy"""
+    return request.access_route[-1] if request.access_route else request.remote_addr
+
+def update_user_id(update):
+    """Telegram user id of a raw update, whichever kind of update it is"""
+    for value in update.values():
+        if isinstance(value, dict) and isinstance(value.get('from'), dict):
+            return value['from'].get('id')
+    return None
+
+def from_telegram():
+    """True if the request carries the webhook secret set with set_webhook"""
+    token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    return hmac.compare_digest(token.encode(), webhook_secret.encode())
+
+@main_bp.before_request
+def limit_by_ip():
+    """Apply per-IP limits; verified Telegram updates are limited per user instead"""
+    if request.endpoint == 'main.telegram_webhook' and from_telegram():
+        return None
+    limit = config.RATELIMIT_WEBHOOK if request.endpoint in WEBHOOK_ENDPOINTS else config.RATELIMIT_DEFAULT
+    if not limiter.hit(limit, f"ip:{client_ip()}"):
+        return jsonify({"status": "error", "message": "Too many requests"}), 429
+    return None
+
 @main_bp.route(f'/{secret}', methods=['POST'])
 def telegram_webhook():
     """Handle Telegram webhook requests"""
+    if not from_telegram():
+        logger.warning(f"Telegram webhook call without a valid secret token from {client_ip()}")
+        return "error", 403
     if request.headers.get('content-type') == 'application/json':
-        json_string = request.get_data().decode('utf-8')
-        update = telebot.types.Update.de_json(json_string)
+        payload = get_request_json(request)
+        user_id = update_user_id(payload) if payload else None
+        if user_id and not limiter.hit(config.RATELIMIT_USER, f"user:{user_id}"):
+            # Acknowledge so Telegram doesn't redeliver the dropped update
+            logger.warning(f"Rate limit exceeded for Telegram user {user_id}")
+            return "ok", 200
+        update = telebot.types.Update.de_json(payload)
         bot.process_new_updates([update])
         return "ok", 200
     return "error", 403
@@ -99,7 +165,7 @@ def coinbase_webhook():
 def flutterwave_webhook():
     """Handle Flutterwave webhooks"""
     try:
-        payload = request.get_json()
+        payload = get_request_json(request)
         
         if payload.get('status') == 'successful':
             # Verify transaction
@@ -107,7 +173,9 @@ def flutterwave_webhook():
             verify_url = f"https://api.flutterwave.com/v3/transactions/{tx_id}/verify"
             headers = {'Authorization': f'Bearer {current_app.config["FLUTTERWAVE_SECRET_KEY"]}'}
             
-            response = requests.get(verify_url, headers=headers).json()
+            response = response_json(
+                provider_request('flutterwave', 'GET', verify_url, headers=headers)
+            )
             
             if (response['status'] == 'success' and 
                 response['data']['status'] == 'successful'):
@@ -119,6 +187,10 @@ def flutterwave_webhook():
                     credit_payment(chat_id, amount)
                     
         return jsonify({"status": "success"}), 200
+    except PROVIDER_UNAVAILABLE as e:
+        # Not the payment's fault; a 5xx makes Flutterwave redeliver it later
+        logger.error(f"Flutterwave webhook verification unavailable: {str(e)}")
+        return jsonify({"status": "error", "message": "Verification temporarily unavailable"}), 503
     except Exception as e:
         logger.error(f"Flutterwave webhook error: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 400
@@ -135,7 +207,7 @@ def paypal_webhook():
         payload['cmd'] = '_notify-validate'
         
         # Send verification request to PayPal
-        verification = requests.post(verify_url, data=payload)
+        verification = provider_request('paypal', 'POST', verify_url, data=payload)
         
         if verification.text == 'VERIFIED':
             if payload.get('payment_status') == 'Completed':
@@ -146,60 +218,231 @@ def paypal_webhook():
                     credit_payment(chat_id, amount)
                     
         return "OK", 200
+    except PROVIDER_UNAVAILABLE as e:
+        # Not the IPN's fault; a 5xx makes PayPal resend it later
+        logger.error(f"PayPal webhook verification unavailable: {str(e)}")
+        return "Verification temporarily unavailable", 503
     except Exception as e:
         logger.error(f"PayPal webhook error: {str(e)}")
         return str(e), 400
 
+# Signed export links stay valid for this many seconds
+EXPORT_LINK_MAX_AGE = 3600
+
+def export_serializer():
+    """Signer for export links, or None while FLASK_SECRET_KEY is unset or the public default"""
+    if not config.SECRET_KEY or config.SECRET_KEY == 'default-insecure-key-for-dev':
+        logger.error("Exports are disabled: set FLASK_SECRET_KEY to a private random value")
+        return None
+    return URLSafeTimedSerializer(config.SECRET_KEY, salt='export')
+
+@main_bp.route("/export/<token>/<kind>", methods=['GET'])
+def export_group(token, kind):
+    """Stream a group's members or payments as CSV or NDJSON"""
+    serializer = export_serializer()
+    if serializer is None:
+        return "Exports are disabled", 503
+    try:
+        group_chat_id = serializer.loads(token, max_age=EXPORT_LINK_MAX_AGE)
+    except BadSignature:
+        return "Invalid or expired export link", 403
+
+    fmt = request.args.get('format', 'csv')
+    after = request.args.get('after')
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    try:
+        chunks = export_stream(group_chat_id, kind, fmt, after, compress)
+    except ValueError as e:
+        return str(e), 400
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{group_chat_id}-{kind}.{fmt}"',
+        'Vary': 'Accept-Encoding'
+    }
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype=FORMATS[fmt], headers=headers)
+
+@bot.message_handler(commands=['export'])
+def export_handler(message):
+    """Send a group admin signed links to export members and payments"""
+    args = message.text.split()[1:]
+    if not args:
+        bot.send_message(message.chat.id, "Usage: /export <group_chat_id>")
+        return
+
+    group = Group.get_by_chat_id(args[0])
+    if not group or group['admin_id'] != str(message.from_user.id):
+        bot.send_message(message.chat.id, "You are not the admin of that group.")
+        return
+
+    serializer = export_serializer()
+    if serializer is None:
+        bot.send_message(message.chat.id, "Exports are not available right now.")
+        return
+
+    token = serializer.dumps(group['chat_id'])
+    links = "\n".join(
+        f"{kind}: {url_for('main.export_group', token=token, kind=kind, _external=True, _scheme='https')}"
+        for kind in ('members', 'payments')
+    )
+    bot.send_message(
+        message.chat.id,
+        f"Your export links (valid for 1 hour, add ?format=ndjson for NDJSON "
+        f"or &after=<cursor> with the first column of the last row to resume):\n{links}"
+    )
+
+def send_prompt(message, text):
+    """Ask the sender for the next step; in groups the answer must be a reply to the bot"""
+    if message.chat.type == 'private':
+        return bot.send_message(message.chat.id, text)
+    return bot.send_message(
+        message.chat.id,
+        text,
+        reply_to_message_id=message.message_id,
+        reply_markup=telebot.types.ForceReply(selective=True)
+    )
+
+def may_answer_step(message):
+    """Cheap check, before any state lookup, that a message could answer a prompt"""
+    if not message.text or message.text.startswith('/'):
+        return False
+    if message.chat.type == 'private':
+        return True
+    reply = message.reply_to_message
+    return bool(reply and reply.from_user and str(reply.from_user.id) == bot.token.split(':')[0])
+
 @bot.message_handler(commands=['deposit'])
 def deposit_handler(message):
     """Handle deposit command"""
+    if not limiter.hit(config.RATELIMIT_DEPOSIT, f"deposit:{message.from_user.id}"):
+        bot.send_message(message.chat.id, "Too many deposit attempts. Please try again later.")
+        return
+    conversations.start(message.from_user.id, 'deposit')
+    send_prompt(
+        message,
+        f"How much would you like to deposit? "
+        f"(${config.MINIMUM_DEPOSIT:.2f} - ${config.MAXIMUM_DEPOSIT:.2f})"
+    )
+
+@bot.message_handler(func=may_answer_step)
+def deposit_step_handler(message):
+    """Route a message to the current step of the sender's deposit flow.
+
+    The step comes from this worker's cache. If a step handler finds it
+    stale (another worker moved the flow on), the message is routed once
+    more against the stored state.
+    """
+    for fresh in (False, True):
+        conversation = conversations.current(message.from_user.id, 'deposit', fresh=fresh)
+        if conversation is None or conversation.step not in ('amount', 'email'):
+            return
+        if conversation.step == 'amount':
+            handled = deposit_amount_handler(message, conversation)
+        else:
+            handled = deposit_email_handler(message, conversation)
+        if handled:
+            return
+
+def deposit_amount_handler(message, conversation):
+    """Handle the deposit amount step; returns False if the conversation was stale"""
+    try:
+        amount = round(float(message.text.strip().lstrip('$')), 2)
+    except (AttributeError, ValueError):
+        if not conversation.is_current():
+            return False
+        send_prompt(message, "Please enter a valid amount, e.g. 25")
+        return True
+
+    if not config.MINIMUM_DEPOSIT <= amount <= config.MAXIMUM_DEPOSIT:
+        if not conversation.is_current():
+            return False
+        send_prompt(
+            message,
+            f"Amount must be between ${config.MINIMUM_DEPOSIT:.2f} and ${config.MAXIMUM_DEPOSIT:.2f}"
+        )
+        return True
+
+    if conversation.advance(amount=amount) is None:
+        return False
+    send_prompt(message, "Please enter your email address for the receipt:")
+    return True
+
+def deposit_email_handler(message, conversation):
+    """Handle the deposit email step; returns False if the conversation was stale"""
+    email = (message.text or '').strip()
+    if '@' not in email or '.' not in email.split('@')[-1]:
+        if not conversation.is_current():
+            return False
+        send_prompt(message, "Please enter a valid email address")
+        return True
+
+    if conversation.advance(email=email) is None:
+        return False
+
+    # Unhealthy providers are hidden or listed last
+    providers = config.get_payment_providers(health=provider_health)
+    if not providers:
+        bot.send_message(
+            message.chat.id,
+            "Sorry, no payment methods are available right now. Please try again later."
+        )
+        return True
+
     markup = telebot.types.InlineKeyboardMarkup()
     
     # Add payment method buttons
-    markup.add(
-        telebot.types.InlineKeyboardButton(
-            "Crypto (Coinbase)", 
-            callback_data="paymethod_coinbase"
-        )
-    )
-    markup.add(
-        telebot.types.InlineKeyboardButton(
-            "Card (Flutterwave)", 
-            callback_data="paymethod_flutterwave"
+    for provider in providers:
+        markup.add(
+            telebot.types.InlineKeyboardButton(
+                PAYMENT_METHOD_LABELS.get(provider['provider'], provider['name']),
+                callback_data=f"paymethod_{provider['provider']}"
+            )
         )
-    )
-    markup.add(
-        telebot.types.InlineKeyboardButton(
-            "PayPal", 
-            callback_data="paymethod_paypal"
-        )
-    )
     
     bot.send_message(
         message.chat.id,
         "Choose your payment method:",
         reply_markup=markup
     )
+    return True
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith('paymethod_'))
 def payment_method_handler(call):
     """Handle payment method selection"""
     chat_id = call.from_user.id
     method = call.data.split('_')[1]
+
+    if method not in PAYMENT_METHOD_LABELS:
+        bot.answer_callback_query(call.id, "Invalid payment method")
+        return
+
+    conversation = conversations.current(chat_id, 'deposit')
+    if conversation is None or conversation.step != 'method':
+        # The cached state may be behind a step handled by another worker
+        conversation = conversations.current(chat_id, 'deposit', fresh=True)
+    if conversation is None or conversation.step != 'method':
+        bot.answer_callback_query(call.id, "Your deposit session has expired, please send /deposit again")
+        return
+    if not limiter.hit(config.RATELIMIT_DEPOSIT, f"deposit:{chat_id}"):
+        bot.answer_callback_query(call.id, "Too many payment attempts. Please try again later.")
+        return
+    if get_breaker(method).state == CircuitBreaker.OPEN:
+        bot.answer_callback_query(call.id, "This payment method is temporarily unavailable, please choose another")
+        return
+    amount = conversation.data['amount']
+    email = conversation.data['email']
     
     # Create payment links based on method
     if method == 'coinbase':
-        charge = create_coinbase_charge(chat_id)
-        payment_link = charge.hosted_url
+        payment_link = payment_api.create_coinbase_charge(chat_id, amount)
     elif method == 'flutterwave':
-        payment_link = create_flutterwave_link(chat_id)
-    elif method == 'paypal':
-        payment_link = create_paypal_link(chat_id)
+        payment_link = payment_api.create_flutterwave_charge(chat_id, email, amount)
     else:
-        bot.answer_callback_query(call.id, "Invalid payment method")
-        return
+        payment_link = payment_api.create_paypal_order(chat_id, amount)
 
     if payment_link:
+        conversation.finish()
         bot.send_message(
             chat_id,
             f"Click the link below to complete your payment:\n{payment_link}"
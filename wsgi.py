@@ -0,0 +1,4 @@
+# Gunicorn entry point. In gevent mode gunicorn's worker monkey-patches the
+# standard library before it imports this module, so pymongo, requests and
+# telebot all load against cooperative sockets; sync workers are left alone.
+from application import app  # noqa: F401